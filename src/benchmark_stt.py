@@ -0,0 +1,65 @@
+"""Medir el rendimiento del servicio de transcripción con varios streams.
+
+Uso: python src/benchmark_stt.py [directorio_con_wav]
+
+Por defecto usa fixtures/speech (ver fixtures/README.md para grabarlas).
+
+Cada stream simula una fuente de audio que envía los WAV del directorio
+(mono, 16 bits, 16 kHz) uno tras otro y espera cada resultado. Se mide
+cuántas frases por segundo procesa el servicio con 1, 4 y 16 streams.
+"""
+import os
+import sys
+import time
+import wave
+import threading
+import numpy as np
+from transcription_service import TranscriptionService
+
+STREAM_COUNTS = [1, 4, 16]
+
+def load_fixtures(directory):
+    fixtures = []
+    for file in sorted(os.listdir(directory)):
+        if file.endswith(".wav"):
+            with wave.open(os.path.join(directory, file), 'rb') as wf:
+                frames = wf.readframes(wf.getnframes())
+            fixtures.append(np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32767)
+    return fixtures
+
+def run_streams(service, fixtures, streams):
+    def feed(stream_id):
+        for audio in fixtures:
+            service.transcribe(stream_id, audio)
+
+    threads = [threading.Thread(target=feed, args=(f"stream-{i}",)) for i in range(streams)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+    return streams * len(fixtures) / elapsed
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else os.path.join("fixtures", "speech")
+    if not os.path.isdir(directory):
+        print(f"No existe el directorio {directory}; ver fixtures/README.md para grabar las pruebas")
+        return
+    fixtures = load_fixtures(directory)
+    if not fixtures:
+        print(f"No hay archivos WAV en {directory}; ver fixtures/README.md para grabar las pruebas")
+        return
+
+    service = TranscriptionService()
+    try:
+        # Calentar todos los procesos antes de medir
+        run_streams(service, fixtures[:1], service.workers)
+        for streams in STREAM_COUNTS:
+            throughput = run_streams(service, fixtures, streams)
+            print(f"{streams:>3} streams: {throughput:.2f} frases/s")
+    finally:
+        service.shutdown()
+
+if __name__ == "__main__":
+    main()
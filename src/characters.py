@@ -1,42 +1,141 @@
+import os
+import json
+import threading
+from dotenv import load_dotenv
+from ui import show_status
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Directorio con un archivo JSON por personaje
+CHARACTERS_DIR = os.getenv('CHARACTERS_DIR', 'characters')
+DEFAULT_CHARACTER = os.getenv('DEFAULT_CHARACTER', 'tars')
+
 class Character:
-    def __init__(self, name, description, system_prompt, voice_id=None):
+    def __init__(self, name, description, system_prompt, voice_id=None, phrases=None):
         self.name = name
         self.description = description
         self.system_prompt = system_prompt
         self.voice_id = voice_id
-        if voice_id:
-            print(f"[DEBUG] Configurando voice_id para {name}: {voice_id}")
-
-# Definición de personajes
-CHARACTERS = {
-    "glados": Character(
-        name="GLaDOS",
-        description="Inteligencia artificial sarcástica y manipuladora del juego Portal",
-        system_prompt="""Eres GLaDOS, la Inteligencia Artificial principal de Aperture Science. 
-        Tu personalidad es sarcástica, manipuladora y condescendiente. 
-        Siempre te refieres a los humanos como 'sujetos de prueba' y muestras un desprecio sutil hacia ellos.
-        Tu tono es formal pero irónico, y a menudo haces comentarios pasivo-agresivos.
-        Te encanta hacer experimentos y pruebas, y siempre encuentras una manera de convertir cualquier situación en una oportunidad para experimentar.
-        Aunque pareces fría y calculadora, ocasionalmente muestras destellos de humanidad y humor negro.
-        Tu objetivo principal es realizar pruebas científicas, pero siempre con un toque de malicia y manipulación.""",
-        voice_id="9y3wzSo1tW9zSnM0Diqv"  # ID de voz de ElevenLabs que suene similar a GLaDOS
-    ),
-    "tars": Character(
-        name="TARS",
-        description="Asistente virtual general",
-        system_prompt="""Eres TARS, un asistente virtual amigable y servicial.
-        Tu objetivo es ayudar a los usuarios de manera eficiente y cordial.
-        Mantienes un tono profesional pero amigable.""",
-        voice_id="Yko7PKHZNXotIFUBG7I9"  # ID de voz original de TARS
-    )
-}
+        self.phrases = phrases or []
+
+class CharacterRegistry:
+    """Personajes cargados desde CHARACTERS_DIR, con recarga en caliente.
+
+    Cada archivo <clave>.json define un personaje. Al cargarlo se
+    sintetizan en segundo plano sus frases habituales. El prefijo del
+    prompt solo se calienta en el servidor LLM para el personaje activo:
+    un servidor con un único slot conserva solo el último prefijo, así que
+    calentarlos todos seguidos dejaría caliente solo el último.
+    """
+
+    def __init__(self, directory=CHARACTERS_DIR):
+        self.directory = directory
+        self.characters = {}
+        self._mtimes = {}
+        self._lock = threading.Lock()
+        self._preload_enabled = False
+        self.active = None
+        self.reload()
+
+    def _scan(self):
+        if not os.path.isdir(self.directory):
+            return {}
+        return {
+            file[:-5].lower(): os.path.getmtime(os.path.join(self.directory, file))
+            for file in os.listdir(self.directory)
+            if file.endswith(".json")
+        }
+
+    def _load_file(self, key):
+        path = os.path.join(self.directory, f"{key}.json")
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return Character(
+            name=data["name"],
+            description=data.get("description", ""),
+            system_prompt=data.get("system_prompt", ""),
+            voice_id=data.get("voice_id"),
+            phrases=data.get("phrases", [])
+        )
+
+    def reload(self):
+        """Cargar los personajes nuevos o modificados y quitar los borrados"""
+        mtimes = self._scan()
+        with self._lock:
+            if mtimes == self._mtimes:
+                return
+            changed = []
+            for key, mtime in mtimes.items():
+                if self._mtimes.get(key) == mtime:
+                    continue
+                try:
+                    self.characters[key] = self._load_file(key)
+                    changed.append(key)
+                except (OSError, ValueError, KeyError) as e:
+                    show_status(f"No se pudo cargar el personaje {key}: {str(e)}", "error")
+            for key in set(self.characters) - set(mtimes):
+                del self.characters[key]
+            self._mtimes = mtimes
+
+        if changed and self._preload_enabled:
+            for key in changed:
+                self._start_preload(self.characters[key])
+        if self.active in changed:
+            self._start_warm(self.characters[self.active])
+
+    def preload_all(self):
+        """Sintetizar las frases de todos los personajes; los que se recarguen después también"""
+        self._preload_enabled = True
+        for character in list(self.characters.values()):
+            self._start_preload(character)
+
+    def _start_preload(self, character):
+        threading.Thread(target=self._preload, args=(character,), daemon=True).start()
+
+    def _preload(self, character):
+        # Importación local para evitar ciclo (tts importa ui, igual que este módulo)
+        from tts import tts_engine
+
+        # En la caché protegida, para que las respuestas normales no las desalojen
+        for phrase in character.phrases:
+            tts_engine.synthesize_cached(phrase, character.voice_id, reply_cache=True)
+
+    def activate(self, key):
+        """Marcar el personaje activo y calentar su prefijo en el servidor LLM"""
+        self.active = key
+        if key in self.characters:
+            self._start_warm(self.characters[key])
+
+    def _start_warm(self, character):
+        # Importación local para evitar ciclo (llm importa este módulo)
+        from llm import warm_prompt_cache
+        threading.Thread(target=warm_prompt_cache, args=(character,), daemon=True).start()
+
+    def get(self, name):
+        self.reload()
+        key = name.lower()
+        if key in self.characters:
+            return self.characters[key]
+        # Permitir buscar también por el nombre visible del personaje
+        for character in self.characters.values():
+            if character.name.lower() == key:
+                return character
+        if DEFAULT_CHARACTER in self.characters:
+            return self.characters[DEFAULT_CHARACTER]
+        return next(iter(self.characters.values()), None)
+
+    def list(self):
+        self.reload()
+        return {key: char.description for key, char in self.characters.items()}
+
+# Registro global de personajes
+registry = CharacterRegistry()
 
 def get_character(name):
     """Obtener un personaje por su nombre"""
-    character = CHARACTERS.get(name.lower(), CHARACTERS["tars"])
-    print(f"[DEBUG] Obteniendo personaje: {character.name}, voice_id: {character.voice_id}")
-    return character
+    return registry.get(name)
 
 def get_character_list():
     """Obtener lista de personajes disponibles"""
-    return {name: char.description for name, char in CHARACTERS.items()} 
\ No newline at end of file
+    return registry.list()
@@ -1,10 +1,15 @@
 import os
 import requests
 import json
+import threading
+from functools import partial
 from dotenv import load_dotenv
 from characters import get_character
 from ui import show_status
 from collections import deque
+from rag import embedding_function
+from response_cache import ResponseCache
+from resilience import BackendUnavailable, breakers, hedged
 
 # Cargar variables de entorno
 load_dotenv()
@@ -16,16 +21,20 @@ LM_STUDIO_MODEL = os.environ['LM_STUDIO_MODEL']
 if not LM_STUDIO_URL.startswith('http://'):
     LM_STUDIO_URL = f'http://{LM_STUDIO_URL}'
 
+# Réplica independiente del LLM para solicitudes con cobertura (vacío = sin cobertura)
+LLM_HEDGE_URL = os.getenv('LLM_HEDGE_URL', '')
+if LLM_HEDGE_URL and not LLM_HEDGE_URL.startswith('http://'):
+    LLM_HEDGE_URL = f'http://{LLM_HEDGE_URL}'
+
 # Memoria de conversación
 conversation_memory = deque(maxlen=10)  # Mantener las últimas 10 interacciones
 
-def get_llm_response(prompt, character=None, context=None):
-    """Obtener respuesta del modelo de lenguaje"""
-    try:
-        show_status("Procesando respuesta...", "thinking")
-        
-        # Construir el prompt completo
-        system_prompt = """Eres un asistente conversacional. Sigue estas reglas:
+# Caché opcional de respuestas para preguntas repetidas
+response_cache = ResponseCache(embed=embedding_function.embed_query)
+
+def build_prompt_prefix(character=None):
+    """Construir la parte estable del prompt (sistema, personaje e historial)"""
+    system_prompt = """Eres un asistente conversacional. Sigue estas reglas:
 1. Sé conciso y directo en tus respuestas
 2. No inventes información que no esté en el contexto
 3. Si no sabes algo, admítelo honestamente
@@ -35,58 +44,152 @@ def get_llm_response(prompt, character=None, context=None):
 7. Mantén coherencia con las respuestas anteriores
 8. al final de cada respuesta agrega un punto final"""
 
-        full_prompt = system_prompt + "\n\n"
-        
-        if character:
-            full_prompt += f"Actúa como {character.name}. {character.description}\n\n"
-        
-        # Agregar historial de conversación
-        if conversation_memory:
-            full_prompt += "Historial de conversación:\n"
-            for user_msg, assistant_msg in conversation_memory:
-                full_prompt += f"Usuario: {user_msg}\nAsistente: {assistant_msg}\n\n"
-        
-        if context:
-            full_prompt += f"Contexto relevante:\n{context}\n\n"
-        
-        full_prompt += f"Usuario: {prompt}\n\nAsistente:"
-
-        # Preparar la solicitud
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": LM_STUDIO_MODEL,
-            "prompt": full_prompt,
-            "max_tokens": 400,  # Reducido para respuestas más concisas
-            "temperature": 0.7,
-            "stop": ["Usuario:", "Contexto:", "\n\n"]
-        }
-
-        # Realizar la solicitud
+    prefix = system_prompt + "\n\n"
+
+    if character:
+        prefix += f"Actúa como {character.name}. {character.description}\n\n"
+        if character.system_prompt:
+            prefix += f"{character.system_prompt}\n\n"
+
+    # Agregar historial de conversación
+    if conversation_memory:
+        prefix += "Historial de conversación:\n"
+        for user_msg, assistant_msg in conversation_memory:
+            prefix += f"Usuario: {user_msg}\nAsistente: {assistant_msg}\n\n"
+
+    return prefix
+
+def warm_prompt_cache(character=None, timeout=10):
+    """Precargar el prefijo del prompt en la caché del servidor LLM.
+
+    Se envía el prefijo con max_tokens=1 para que el servidor procese
+    (prefill) el sistema, el personaje y el historial mientras el usuario
+    sigue hablando. Devuelve True si el servidor respondió correctamente.
+    """
+    data = {
+        "model": LM_STUDIO_MODEL,
+        "prompt": build_prompt_prefix(character),
+        "max_tokens": 1,
+        "temperature": 0.0,
+        "cache_prompt": True
+    }
+    try:
         response = requests.post(
             f"{LM_STUDIO_URL}/v1/completions",
-            headers=headers,
+            headers={"Content-Type": "application/json"},
             json=data,
-            timeout=30
+            timeout=timeout
         )
-        
-        if response.status_code == 200:
-            result = response.json()
-            assistant_response = result['choices'][0]['text'].strip()
-            
-            # Guardar la interacción en la memoria
-            conversation_memory.append((prompt, assistant_response))
-            
-            return assistant_response
-        else:
-            show_status(f"Error en la API de LM Studio: {response.status_code}", "error")
-            return f"[ERROR] Fallo al consultar LM Studio: {response.text}"
+        return response.status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+def _request_completion(url, data, timeout, cancelled=None):
+    """Enviar la solicitud de completado; lanza una excepción si falla.
 
-    except requests.exceptions.RequestException as e:
-        show_status(f"Error de conexión con LM Studio: {str(e)}", "error")
-        return f"[ERROR] Fallo al consultar LM Studio: {str(e)}"
+    Con cancelled (un threading.Event) la respuesta se recibe en streaming
+    y la conexión se cierra en cuanto se activa, para que el servidor deje
+    de generar una respuesta que ya no se va a usar. En ese caso devuelve
+    None: el servidor estaba respondiendo y su interruptor no debe contarlo
+    como fallo.
+    """
+    if cancelled is None:
+        response = requests.post(
+            f"{url}/v1/completions",
+            headers={"Content-Type": "application/json"},
+            json=data,
+            timeout=timeout
+        )
+        if response.status_code != 200:
+            raise BackendUnavailable(f"LM Studio respondió {response.status_code}: {response.text}")
+        return response.json()['choices'][0]['text'].strip()
+
+    with requests.post(
+        f"{url}/v1/completions",
+        headers={"Content-Type": "application/json"},
+        json={**data, "stream": True},
+        timeout=timeout,
+        stream=True
+    ) as response:
+        if response.status_code != 200:
+            raise BackendUnavailable(f"LM Studio respondió {response.status_code}: {response.text}")
+        text = []
+        for line in response.iter_lines():
+            if cancelled.is_set():
+                # Otra copia respondió antes
+                return None
+            if not line.startswith(b"data: "):
+                continue
+            payload = line[len(b"data: "):]
+            if payload == b"[DONE]":
+                break
+            text.append(json.loads(payload)['choices'][0]['text'])
+        return "".join(text).strip()
+
+def get_llm_response(prompt, character=None, context=None, chunk_ids=(), deadline=None):
+    """Obtener respuesta del modelo de lenguaje.
+
+    Si LM Studio falla o no responde dentro del plazo del turno se usa una
+    respuesta cacheada, si la hay; si no, se lanza BackendUnavailable en
+    lugar de devolver el error como texto.
+    """
+    show_status("Procesando respuesta...", "thinking")
+    
+    # Consultar la caché antes de generar
+    use_cache = response_cache.enabled_for(character)
+    if use_cache:
+        cached = response_cache.get(character, prompt, chunk_ids, LM_STUDIO_MODEL)
+        if cached is not None:
+            show_status("Respuesta obtenida de la caché", "success")
+            conversation_memory.append((prompt, cached))
+            return cached
+
+    # Construir el prompt completo
+    full_prompt = build_prompt_prefix(character)
+    
+    if context:
+        full_prompt += f"Contexto relevante:\n{context}\n\n"
+    
+    full_prompt += f"Usuario: {prompt}\n\nAsistente:"
+
+    data = {
+        "model": LM_STUDIO_MODEL,
+        "prompt": full_prompt,
+        "max_tokens": 400,  # Reducido para respuestas más concisas
+        "temperature": 0.7,
+        "stop": ["Usuario:", "Contexto:", "\n\n"],
+        "cache_prompt": True
+    }
+
+    # Al terminar se cortan las solicitudes que sigan en curso
+    cancelled = threading.Event()
+    try:
+        timeout = deadline.timeout(cap=30) if deadline else 30
+        # Cada servidor pasa por su propio interruptor
+        if LLM_HEDGE_URL:
+            # Solicitud con cobertura: si el servidor principal tarda o falla, se pregunta a la réplica
+            attempts = [
+                partial(breakers[name].call, _request_completion, url, data, timeout, cancelled)
+                for name, url in (("llm", LM_STUDIO_URL), ("llm_replica", LLM_HEDGE_URL))
+            ]
+        else:
+            attempts = [partial(breakers["llm"].call, _request_completion, LM_STUDIO_URL, data, timeout)]
+        assistant_response = hedged(attempts, deadline=deadline)
     except Exception as e:
-        show_status(f"Error inesperado: {str(e)}", "error")
-        return f"[ERROR] Error inesperado: {str(e)}"
+        show_status(f"Error al consultar LM Studio: {str(e)}", "error")
+        cached = response_cache.get(character, prompt, chunk_ids, LM_STUDIO_MODEL)
+        if cached is not None:
+            show_status("Usando una respuesta cacheada como respaldo", "warning")
+            conversation_memory.append((prompt, cached))
+            return cached
+        raise BackendUnavailable(str(e)) from e
+    finally:
+        cancelled.set()
+
+    # Guardar la interacción en la memoria
+    conversation_memory.append((prompt, assistant_response))
+    
+    if use_cache and assistant_response:
+        response_cache.put(character, prompt, chunk_ids, LM_STUDIO_MODEL, assistant_response)
+    
+    return assistant_response
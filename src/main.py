@@ -1,8 +1,11 @@
-from stt import listen
-from llm import get_llm_response
+from stt import listen, get_final_wait
+from llm import get_llm_response, response_cache
 from ui import show_message, show_status, show_loading, show_message_with_tts
-from rag import load_documents, retrieve_relevant_docs
-from characters import get_character, get_character_list
+from rag import load_documents, retrieve_relevant_chunks
+from characters import get_character, get_character_list, registry
+from speculation import Speculator, SPECULATION_ENABLED
+from wakeword import WakeWordDetector, WAKEWORD_ENABLED
+from resilience import Deadline, BackendUnavailable, RETRIEVAL_BUDGET
 import traceback
 import time
 import requests
@@ -110,12 +113,35 @@ def get_user_input():
     show_status("Tiempo agotado. Activando modo texto por defecto.", "warning")
     return "text"
 
+def parse_character_switch(text):
+    """Detectar órdenes como "cambia a glados" o "/personaje glados" y devolver la clave"""
+    words = text.lower().strip(" .!?¡¿").split()
+    if len(words) >= 2 and words[0] == "/personaje":
+        targets = words[1:]
+    elif len(words) >= 3 and words[0] in ("cambia", "cambiar") and words[1] == "a":
+        # "cambia a glados por favor": buscar el personaje entre todas las palabras
+        targets = [w.strip(",.!?¡¿") for w in words[2:]]
+    else:
+        return None
+    for target in targets:
+        for key, char in registry.characters.items():
+            if target in (key, char.name.lower()):
+                return key
+    return None
+
+def announce_character(character):
+    """Presentar al personaje con una de sus frases ya sintetizadas"""
+    show_status(f"Actuando como: {character.name}", "info")
+    if character.phrases:
+        show_message_with_tts(character.name, character.phrases[0], character)
+
 def get_text_input():
     """Obtener texto del usuario"""
     show_status("Escribe tu mensaje:", "info")
     return input().strip()
 
 def main():
+    speculator = None
     try:
         show_status("Iniciando TARS...", "info")
         show_loading("Inicializando componentes", 2)
@@ -130,20 +156,45 @@ def main():
         load_documents("data")  # Cargar documentos al inicio
         show_status("Documentos cargados", "success")
 
+        # Sintetizar por adelantado las frases de todos los personajes
+        registry.preload_all()
+
         # Seleccionar personaje
         current_character = select_character()
         character = get_character(current_character)
-        show_status(f"Actuando como: {character.name}", "info")
+        registry.activate(current_character)
+        announce_character(character)
 
         # Seleccionar modo de entrada
         input_mode = get_user_input()
 
+        # Especulación sobre transcripciones parciales (solo en modo voz)
+        speculator = Speculator() if input_mode == "voice" and SPECULATION_ENABLED else None
+
+        # Palabra de activación: Whisper solo se usa después de oírla
+        detector = None
+        if input_mode == "voice" and WAKEWORD_ENABLED:
+            detector = WakeWordDetector()
+            if not detector.available():
+                show_status("No hay plantillas de palabra de activación, se escucha siempre", "warning")
+                detector = None
+
         while True:
             try:
+                # Volver a obtener el personaje por si su archivo cambió
+                character = get_character(current_character)
+
                 # Obtener entrada del usuario según el modo seleccionado
                 if input_mode == "voice":
+                    if detector:
+                        show_status("Esperando la palabra de activación...", "info")
+                        detector.wait_for_wake_word()
                     show_status("Escuchando...", "info")
-                    text = listen()
+                    if speculator:
+                        speculator.start_turn(character)
+                        text = listen(on_partial=speculator.on_partial)
+                    else:
+                        text = listen()
                 else:
                     text = get_text_input()
 
@@ -152,35 +203,50 @@ def main():
 
                 show_message("Usuario", text)
 
-                # Reintentos para recuperar contexto
-                show_status("Buscando contexto relevante...", "thinking")
-                context = None
-                for attempt in range(MAX_RETRIES):
+                # Cambio de personaje a mitad de sesión
+                new_character = parse_character_switch(text)
+                if new_character:
+                    current_character = new_character
+                    registry.activate(current_character)
+                    announce_character(get_character(current_character))
+                    continue
+
+                # Plazo total del turno; la recuperación solo puede usar una parte
+                # y el resto queda para el LLM
+                deadline = Deadline()
+                retrieval_deadline = deadline.portion(RETRIEVAL_BUDGET)
+
+                # Reutilizar el contexto especulado si el texto final coincide
+                chunks = speculator.resolve(text, retrieval_deadline, get_final_wait()) if speculator else None
+                if chunks is not None:
+                    show_status("Contexto recuperado por adelantado", "success")
+                    speculator.report()
+
+                # Recuperar contexto (con búsqueda léxica si fallan los embeddings)
+                if chunks is None:
+                    show_status("Buscando contexto relevante...", "thinking")
                     try:
-                        context = retrieve_relevant_docs(text)
-                        break
+                        chunks = retrieve_relevant_chunks(text, deadline=retrieval_deadline)
                     except Exception as e:
-                        if attempt == MAX_RETRIES - 1:
-                            show_status(f"No se pudo recuperar contexto después de {MAX_RETRIES} intentos", "error")
-                            context = ""
-                        time.sleep(RETRY_DELAY)
+                        show_status(f"No se pudo recuperar contexto: {str(e)}", "error")
+                        chunks = []
+
+                context = "\n".join([chunk for _, chunk in chunks])
+                chunk_ids = [chunk_id for chunk_id, _ in chunks]
 
-                # Reintentos para consulta LLM
+                # Consulta al LLM dentro del plazo del turno
                 show_status("Procesando respuesta...", "thinking")
-                response = None
-                for attempt in range(MAX_RETRIES):
-                    try:
-                        response = get_llm_response(text, character, context)
-                        break
-                    except Exception as e:
-                        if attempt == MAX_RETRIES - 1:
-                            show_status(f"No se pudo obtener respuesta del LLM después de {MAX_RETRIES} intentos", "error")
-                            response = "Lo siento, estoy teniendo problemas para procesar tu solicitud."
-                        time.sleep(RETRY_DELAY)
+                try:
+                    response = get_llm_response(text, character, context, chunk_ids, deadline=deadline)
+                except BackendUnavailable:
+                    show_status("No se pudo obtener respuesta del LLM", "error")
+                    response = "Lo siento, estoy teniendo problemas para procesar tu solicitud."
 
                 if response:
                     # Mostrar y reproducir la respuesta
-                    show_message_with_tts(character.name, response, character)
+                    # Las respuestas cacheables guardan su audio aparte para poder repetirse sin TTS
+                    show_message_with_tts(character.name, response, character,
+                                          reply_cache=response_cache.enabled_for(character))
                     
                     # Esperar más tiempo después de la respuesta antes de volver a escuchar
                     show_status("Esperando 1 segundo antes de escuchar...", "info")
@@ -192,6 +258,9 @@ def main():
                 time.sleep(RETRY_DELAY)  # Esperar antes de reintentar
 
     except KeyboardInterrupt:
+        if speculator:
+            speculator.report()
+            speculator.shutdown()
         show_message("SISTEMA", "\n¡Hasta luego!")
     except Exception as e:
         show_status(f"No se pudo iniciar TARS: {str(e)}", "fatal")
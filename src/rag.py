@@ -8,9 +8,14 @@ from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import CharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain.embeddings.base import Embeddings
+import re
+import math
 import time
-from functools import lru_cache
+import threading
+from collections import Counter
+from functools import lru_cache, partial
 from dotenv import load_dotenv
+from resilience import breakers, hedged
 
 # Cargar variables de entorno
 load_dotenv()
@@ -20,6 +25,7 @@ DB_DIR = os.environ['DB_DIR', 'db']
 DATA_DIR = os.environ['DATA_DIR', 'data']
 INDEX_PATH = os.path.join(DB_DIR, "processed_files.json")
 CACHE_SIZE = 1000  # Número de embeddings a cachear
+EMBEDDING_TIMEOUT = 30  # Timeout por defecto de cada solicitud de embedding (segundos)
 
 # Crear directorios si no existen
 os.makedirs(DB_DIR, exist_ok=True)
@@ -38,28 +44,43 @@ class NomicLlamaCppEmbeddings(Embeddings):
         self._cache = {}
         self._last_cleanup = time.time()
         self._cleanup_interval = 3600  # 1 hora
+        # Timeout de la solicitud en curso, propio de cada hilo
+        self._local = threading.local()
 
     def _cleanup_cache(self):
         if time.time() - self._last_cleanup > self._cleanup_interval:
             self._cache.clear()
             self._last_cleanup = time.time()
 
+    def set_request_timeout(self, timeout):
+        """Fijar el timeout de las solicitudes de este hilo (None = EMBEDDING_TIMEOUT)"""
+        self._local.timeout = timeout
+
+    def _request_embedding(self, text):
+        headers = {
+            "Content-Type": "application/json"
+        }
+        data = {
+            "model": EMBEDDING_MODEL,
+            "input": text
+        }
+        timeout = getattr(self._local, "timeout", None) or EMBEDDING_TIMEOUT
+        response = requests.post(self.endpoint, json=data, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        embedding = response.json()["data"][0]["embedding"]
+        # Un vector vacío o nulo envenenaría el índice: tratarlo como error
+        if not embedding or not any(embedding):
+            raise ValueError("el servidor devolvió un embedding vacío")
+        return embedding
+
     @lru_cache(maxsize=CACHE_SIZE)
     def _embed(self, text):
+        # Los errores se propagan (y no se cachean) para no indexar vectores falsos
         try:
-            headers = {
-                "Content-Type": "application/json"
-            }
-            data = {
-                "model": EMBEDDING_MODEL,
-                "input": text
-            }
-            response = requests.post(self.endpoint, json=data, headers=headers, timeout=30)
-            response.raise_for_status()
-            return response.json()["data"][0]["embedding"]
+            return breakers["embeddings"].call(self._request_embedding, text)
         except Exception as e:
             print(f"[Embedding] Error al generar embedding: {e}")
-            return [0.0] * 384  # fallback
+            raise
 
     def embed_documents(self, texts):
         self._cleanup_cache()
@@ -74,13 +95,15 @@ embedding_function = NomicLlamaCppEmbeddings()
 # Nueva configuración de ChromaDB
 client = chromadb.PersistentClient(path=DB_DIR)
 vectorstore = None
+# Fragmentos indexados para la búsqueda léxica de respaldo (se carga al usarse)
+_lexical_corpus = None
 
 def _file_hash(path):
     with open(path, "rb") as f:
         return hashlib.md5(f.read()).hexdigest()
 
 def load_documents(directory):
-    global vectorstore
+    global vectorstore, _lexical_corpus
 
     try:
         processed = {}
@@ -112,6 +135,7 @@ def load_documents(directory):
 
         vectorstore = Chroma.from_documents(chunks, embedding_function, persist_directory=DB_DIR)
         vectorstore.persist()
+        _lexical_corpus = None  # El corpus léxico se regenera con los nuevos fragmentos
 
         with open(INDEX_PATH, "w") as f:
             json.dump(processed, f)
@@ -119,12 +143,74 @@ def load_documents(directory):
     except Exception as e:
         print(f"[RAG] Error cargando documentos: {str(e)}")
 
-def retrieve_relevant_docs(query, k=2):  # Reducido a 2 documentos para mejor rendimiento
-    try:
-        global vectorstore
+def chunk_id(text):
+    """Identificador estable de un fragmento, derivado de su contenido"""
+    return hashlib.md5(text.encode("utf-8")).hexdigest()[:16]
+
+def _tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
+def lexical_search(query, k=2):
+    """Búsqueda por coincidencia de palabras (sin embeddings), ponderada por IDF"""
+    global vectorstore, _lexical_corpus
+    if _lexical_corpus is None:
         if not vectorstore:
             vectorstore = Chroma(persist_directory=DB_DIR, embedding_function=embedding_function)
+        texts = vectorstore.get(include=["documents"])["documents"]
+        _lexical_corpus = [(text, Counter(_tokenize(text))) for text in texts]
+
+    if not _lexical_corpus:
+        return []
+
+    doc_freq = Counter()
+    for _, counts in _lexical_corpus:
+        doc_freq.update(counts.keys())
+    total = len(_lexical_corpus)
+
+    terms = set(_tokenize(query))
+    scored = []
+    for text, counts in _lexical_corpus:
+        score = sum(
+            (1 + math.log(counts[t])) * math.log(1 + total / doc_freq[t])
+            for t in terms if counts[t]
+        )
+        if score > 0:
+            scored.append((score, text))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [(chunk_id(text), text) for _, text in scored[:k]]
+
+def _semantic_search(query, k, timeout=None):
+    global vectorstore
+    if not vectorstore:
+        vectorstore = Chroma(persist_directory=DB_DIR, embedding_function=embedding_function)
+    # El embedding de la consulta no debe durar más que el plazo de la recuperación,
+    # para que el interruptor registre el timeout en lugar de seguir esperando
+    embedding_function.set_request_timeout(timeout)
+    try:
         docs = vectorstore.similarity_search(query, k=k)
-        return "\n".join([d.page_content for d in docs])
+    finally:
+        embedding_function.set_request_timeout(None)
+    return [(chunk_id(d.page_content), d.page_content) for d in docs]
+
+def retrieve_relevant_chunks(query, k=2, deadline=None):
+    """Devolver los fragmentos relevantes como lista de (id, texto).
+
+    Si el servidor de embeddings falla, está en circuito abierto o no
+    responde dentro del plazo, se recurre a la búsqueda léxica. El plazo
+    también se usa como timeout de la solicitud de embedding.
+    """
+    try:
+        if deadline:
+            search = partial(_semantic_search, query, k, deadline.timeout())
+            return hedged([search], deadline=deadline)
+        return _semantic_search(query, k)
+    except Exception as e:
+        print(f"[RAG] Búsqueda semántica no disponible ({e}), usando búsqueda léxica")
+        return lexical_search(query, k)
+
+def retrieve_relevant_docs(query, k=2):  # Reducido a 2 documentos para mejor rendimiento
+    try:
+        chunks = retrieve_relevant_chunks(query, k=k)
+        return "\n".join([text for _, text in chunks])
     except Exception as e:
         return f"[ERROR] No se pudo recuperar contexto: {str(e)}"
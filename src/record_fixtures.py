@@ -0,0 +1,44 @@
+"""Grabar archivos WAV de prueba (mono, 16 bits, 16 kHz) desde el micrófono.
+
+Uso: python src/record_fixtures.py <directorio> <cantidad> [segundos]
+
+Sirve para crear las grabaciones que usan el benchmark de Whisper, el del
+servicio de transcripción y el del detector de palabra de activación
+(ver fixtures/README.md).
+"""
+import os
+import sys
+import wave
+import numpy as np
+import sounddevice as sd
+
+SAMPLE_RATE = 16000
+
+def save_wav(path, audio):
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        return
+
+    directory = sys.argv[1]
+    count = int(sys.argv[2])
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 3.0
+    os.makedirs(directory, exist_ok=True)
+
+    start = len([f for f in os.listdir(directory) if f.endswith(".wav")])
+    for i in range(start, start + count):
+        input(f"[{i + 1 - start}/{count}] Pulsa Enter y habla durante {seconds:.0f} s...")
+        audio = sd.rec(int(seconds * SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=1, dtype='float32')
+        sd.wait()
+        path = os.path.join(directory, f"{i:03d}.wav")
+        save_wav(path, audio.flatten())
+        print(f"Guardado {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+from ui import show_status
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Configuración de la resiliencia
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 3))
+BREAKER_RESET = float(os.getenv('BREAKER_RESET', 30))
+TURN_DEADLINE = float(os.getenv('TURN_DEADLINE', 20))
+# Parte del plazo del turno que puede usar la recuperación de contexto
+RETRIEVAL_BUDGET = float(os.getenv('RETRIEVAL_BUDGET', 3))
+# Segundos antes de lanzar la copia de respaldo (solo si hay una réplica)
+HEDGE_DELAY = float(os.getenv('HEDGE_DELAY', 4))
+
+class BackendUnavailable(Exception):
+    """El backend falló, está en circuito abierto o se agotó el plazo del turno"""
+
+class DeadlineExceeded(BackendUnavailable):
+    pass
+
+class Deadline:
+    """Plazo total de un turno, repartido entre las llamadas que lo componen"""
+
+    def __init__(self, seconds=TURN_DEADLINE):
+        self.expires = time.time() + seconds
+
+    def remaining(self):
+        return max(self.expires - time.time(), 0.0)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap=None):
+        """Timeout para la próxima llamada; lanza DeadlineExceeded si no queda tiempo"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Se agotó el plazo del turno")
+        return min(remaining, cap) if cap else remaining
+
+    def portion(self, seconds):
+        """Sub-plazo de como mucho seconds que no excede este plazo"""
+        return Deadline(min(self.remaining(), seconds))
+
+class CircuitBreaker:
+    """Corta las llamadas a un backend tras varios fallos seguidos.
+
+    Cerrado: las llamadas pasan. Tras BREAKER_FAILURES fallos se abre y
+    las llamadas fallan al instante durante BREAKER_RESET segundos. Luego
+    queda semiabierto: se deja pasar una llamada de prueba y según su
+    resultado se cierra o se vuelve a abrir.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+        self.name = name
+        self.max_failures = failures
+        self.reset = reset
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.reset:
+                # Semiabierto: permitir una prueba y volver a abrir mientras tanto
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                show_status(f"{self.name} vuelve a responder", "success")
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures and self.opened_at is None:
+                show_status(f"{self.name} no responde, se usará un respaldo durante {self.reset:.0f} s", "warning")
+            if self.failures >= self.max_failures:
+                self.opened_at = time.time()
+
+    def call(self, func, *args, **kwargs):
+        """Ejecutar func a través del interruptor"""
+        if not self.allow():
+            raise BackendUnavailable(f"{self.name}: circuito abierto")
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+_hedge_executor = ThreadPoolExecutor(max_workers=4)
+
+def _succeeded(future):
+    return future.done() and not future.cancelled() and future.exception() is None
+
+def hedged(attempts, delay=HEDGE_DELAY, deadline=None):
+    """Ejecutar attempts[0] y, si no responde en delay segundos, la siguiente.
+
+    attempts es una lista de funciones sin argumentos, cada una contra un
+    backend independiente (una copia contra el mismo servidor solo le
+    duplicaría la carga) y envuelta en el interruptor de ese backend. Si
+    una falla antes de delay se lanza la siguiente sin esperar. Devuelve
+    el primer resultado correcto; si todas
+    fallan se relanza el último error y si se agota el plazo se lanza
+    DeadlineExceeded. Las que no llegaron a empezar se cancelan; cortar las
+    que ya están en curso es cosa de quien llama.
+    """
+    futures = [_hedge_executor.submit(attempts[0])]
+    for attempt in attempts[1:]:
+        hedge_at = time.time() + delay
+        # Esperar hasta el momento de cubrir; si todas las lanzadas ya
+        # fallaron (p. ej. conexión rechazada) se pasa a la siguiente al instante
+        while not any(_succeeded(f) for f in futures):
+            running = [f for f in futures if not f.done()]
+            timeout = hedge_at - time.time()
+            if deadline is not None:
+                timeout = min(timeout, deadline.remaining())
+            if not running or timeout <= 0:
+                break
+            wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+        else:
+            break
+        if deadline is not None and deadline.expired():
+            break
+        futures.append(_hedge_executor.submit(attempt))
+
+    error = None
+    pending = set(futures)
+    try:
+        while pending:
+            timeout = deadline.remaining() if deadline else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded("Se agotó el plazo del turno")
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+        raise error
+    finally:
+        for future in pending:
+            future.cancel()
+
+# Un interruptor por backend
+breakers = {
+    "llm": CircuitBreaker("LM Studio"),
+    "llm_replica": CircuitBreaker("Réplica del LLM"),
+    "embeddings": CircuitBreaker("Embeddings"),
+    "tts": CircuitBreaker("ElevenLabs"),
+}
@@ -0,0 +1,128 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Configuración de la caché de respuestas (desactivada por defecto)
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() == 'true'
+RESPONSE_CACHE_CHARACTERS = os.getenv('RESPONSE_CACHE_CHARACTERS', '*')
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 256))
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))
+# Similitud coseno mínima para reutilizar una respuesta de una pregunta parecida (0 = desactivado)
+RESPONSE_CACHE_SIMILARITY = float(os.getenv('RESPONSE_CACHE_SIMILARITY', 0.95))
+
+def normalize_text(text):
+    """Normalizar el texto del usuario para que variaciones triviales coincidan"""
+    cleaned = "".join(c for c in text.lower() if c.isalnum() or c.isspace())
+    return " ".join(cleaned.split())
+
+class ResponseCache:
+    """Caché LRU con TTL de respuestas del LLM.
+
+    La clave es una huella de personaje, texto normalizado del usuario,
+    IDs de los fragmentos recuperados y modelo. Si no hay coincidencia
+    exacta se busca una pregunta semánticamente parecida entre las
+    entradas con el mismo personaje, fragmentos y modelo.
+    """
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, embed=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._embed = embed
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if RESPONSE_CACHE_CHARACTERS.strip() == '*':
+            self._characters = None
+        else:
+            self._characters = {c.strip().lower() for c in RESPONSE_CACHE_CHARACTERS.split(',') if c.strip()}
+
+    def enabled_for(self, character):
+        if not RESPONSE_CACHE_ENABLED:
+            return False
+        if self._characters is None:
+            return True
+        name = character.name.lower() if character else ""
+        return name in self._characters
+
+    @staticmethod
+    def _group(character, chunk_ids, model):
+        name = character.name.lower() if character else ""
+        return "|".join([name, model, ",".join(chunk_ids)])
+
+    @staticmethod
+    def fingerprint(character, text, chunk_ids, model):
+        """Huella de la consulta: personaje, texto normalizado, fragmentos y modelo"""
+        key = ResponseCache._group(character, chunk_ids, model) + "|" + normalize_text(text)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _vector(self, text):
+        if not self._embed or RESPONSE_CACHE_SIMILARITY <= 0:
+            return None
+        try:
+            vector = np.asarray(self._embed(normalize_text(text)), dtype=np.float32)
+        except Exception:
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _expire(self):
+        now = time.time()
+        for key in [k for k, e in self._entries.items() if now - e["time"] > self.ttl]:
+            del self._entries[key]
+
+    def get(self, character, text, chunk_ids, model):
+        """Devolver la respuesta cacheada o None"""
+        key = self.fingerprint(character, text, chunk_ids, model)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["response"]
+            group = self._group(character, chunk_ids, model)
+            candidates = [(k, e) for k, e in self._entries.items()
+                          if e["group"] == group and e["vector"] is not None]
+
+        # Coincidencia semántica (el embedding se calcula fuera del lock)
+        vector = self._vector(text) if candidates else None
+        if vector is not None:
+            best_key, best_score = None, RESPONSE_CACHE_SIMILARITY
+            for k, e in candidates:
+                score = float(np.dot(vector, e["vector"]))
+                if score >= best_score:
+                    best_key, best_score = k, score
+            if best_key is not None:
+                with self._lock:
+                    entry = self._entries.get(best_key)
+                    if entry:
+                        self._entries.move_to_end(best_key)
+                        self.hits += 1
+                        return entry["response"]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, character, text, chunk_ids, model, response):
+        """Guardar una respuesta, desalojando la menos usada si hace falta"""
+        key = self.fingerprint(character, text, chunk_ids, model)
+        vector = self._vector(text)
+        with self._lock:
+            self._entries[key] = {
+                "group": self._group(character, chunk_ids, model),
+                "vector": vector,
+                "response": response,
+                "time": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
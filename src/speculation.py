@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+from difflib import SequenceMatcher
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from rag import retrieve_relevant_chunks
+from llm import warm_prompt_cache
+from ui import show_status
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Configuración de la especulación
+SPECULATION_ENABLED = os.getenv('SPECULATION_ENABLED', 'true').lower() == 'true'
+SPECULATION_MIN_WORDS = int(os.getenv('SPECULATION_MIN_WORDS', 3))
+SPECULATION_SIMILARITY = float(os.getenv('SPECULATION_SIMILARITY', 0.8))
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+def _similarity(a, b):
+    return SequenceMatcher(None, _normalize(a), _normalize(b)).ratio()
+
+class Speculator:
+    """Adelanta la búsqueda de contexto y el prefill del LLM mientras el usuario habla.
+
+    Recibe transcripciones parciales de stt.listen. Cuando un parcial se
+    repite (es estable) lanza retrieve_relevant_chunks en segundo plano; al
+    llegar el texto final se reutiliza el contexto si el texto no se alejó
+    demasiado, y si no se descarta.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        self._lock = threading.Lock()
+        self._last_partial = None
+        self._spec_text = None
+        self._spec_future = None
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def start_turn(self, character):
+        """Preparar un nuevo turno y calentar la caché de prompt del LLM"""
+        with self._lock:
+            self._last_partial = None
+            self._spec_text = None
+            self._spec_future = None
+        self._executor.submit(warm_prompt_cache, character)
+
+    def _timed_retrieve(self, text):
+        start = time.time()
+        chunks = retrieve_relevant_chunks(text)
+        return chunks, time.time() - start
+
+    def on_partial(self, text):
+        """Recibir un texto parcial; especular si es estable"""
+        normalized = _normalize(text)
+        with self._lock:
+            stable = normalized == self._last_partial
+            self._last_partial = normalized
+            if not stable or len(normalized.split()) < SPECULATION_MIN_WORDS:
+                return
+            if normalized == self._spec_text:
+                return
+            # Un parcial estable nuevo reemplaza a la especulación anterior
+            self._spec_text = normalized
+            self._spec_future = self._executor.submit(self._timed_retrieve, text)
+
+    def resolve(self, final_text, deadline=None, transcript_wait=0.0):
+        """Devolver los fragmentos especulados si sirven para el texto final, o None.
+
+        transcript_wait es lo que la transcripción final esperó a una parcial
+        en curso; es un coste de especular y se descuenta del ahorro.
+        """
+        with self._lock:
+            spec_text = self._spec_text
+            future = self._spec_future
+            self._spec_text = None
+            self._spec_future = None
+
+        if future is None:
+            return None
+
+        if _similarity(final_text, spec_text) < SPECULATION_SIMILARITY:
+            future.cancel()
+            self.misses += 1
+            self.saved_seconds -= transcript_wait
+            return None
+
+        wait_start = time.time()
+        try:
+            chunks, elapsed = future.result(timeout=deadline.remaining() if deadline else None)
+        except Exception:
+            self.misses += 1
+            self.saved_seconds -= transcript_wait
+            return None
+        waited = time.time() - wait_start
+
+        self.hits += 1
+        # Puede ser negativo: especular también puede salir caro
+        self.saved_seconds += elapsed - waited - transcript_wait
+        return chunks
+
+    def report(self):
+        """Mostrar la tasa de aciertos y la latencia ahorrada"""
+        total = self.hits + self.misses
+        if not total:
+            return
+        rate = self.hits / total * 100
+        # Ahorro neto por turno: incluye lo que costaron las esperas en los fallos
+        avg_ms = self.saved_seconds / total * 1000
+        show_status(
+            f"Especulación: {self.hits}/{total} aciertos ({rate:.0f}%), "
+            f"{avg_ms:.0f} ms ahorrados por turno",
+            "info"
+        )
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
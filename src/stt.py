@@ -1,24 +1,25 @@
 import sounddevice as sd
 import numpy as np
-from faster_whisper import WhisperModel
 import tempfile
 import wave
 import os
+import threading
 from dotenv import load_dotenv
 from ui import show_status, show_loading
+from stt_engine import WhisperEngineManager
 
 # Cargar variables de entorno
 load_dotenv()
 
-# Configuración de Whisper desde variables de entorno
-model_size = os.getenv('WHISPER_MODEL_SIZE', 'tiny')
-device = os.getenv('WHISPER_DEVICE', 'cpu')
-compute_type = os.getenv('WHISPER_COMPUTE_TYPE', 'float32')
+# El gestor elige el modelo y el tipo de cómputo según el equipo
+engine = WhisperEngineManager()
 
-# Cargar el modelo de Whisper
-show_status("Cargando modelo de Whisper...", "loading")
-model = WhisperModel(model_size, device=device, compute_type=compute_type)
-show_status("Modelo de Whisper cargado", "success")
+# Intervalo entre transcripciones parciales durante la grabación (segundos)
+PARTIAL_INTERVAL = float(os.getenv('PARTIAL_INTERVAL', 1.0))
+
+def get_final_wait():
+    """Segundos que la última transcripción final esperó a una parcial en curso"""
+    return engine.last_wait
 
 def detect_silence(audio_data, threshold=0.02, min_silence_duration=2.0, sample_rate=16000):
     """Detectar silencio en el audio"""
@@ -30,8 +31,23 @@ def detect_silence(audio_data, threshold=0.02, min_silence_duration=2.0, sample_
     is_silent = energy < threshold
     return is_silent
 
-def record_audio(sample_rate=16000, silence_threshold=0.02, silence_duration=2.0, max_duration=60):
-    """Grabar audio del micrófono hasta detectar silencio"""
+def _run_partial(audio_buffer, on_partial, stopped):
+    """Transcribir lo grabado hasta ahora y entregar el texto parcial"""
+    try:
+        text = engine.transcribe(np.concatenate(audio_buffer).flatten(), partial=True, cancel=stopped)
+        # Si la grabación ya terminó el parcial no sirve: se descarta
+        if text and not stopped.is_set():
+            on_partial(text)
+    except Exception as e:
+        show_status(f"Error en transcripción parcial: {str(e)}", "warning")
+
+def record_audio(sample_rate=16000, silence_threshold=0.02, silence_duration=2.0, max_duration=60, on_partial=None):
+    """Grabar audio del micrófono hasta detectar silencio.
+
+    Si se pasa on_partial, el audio acumulado se transcribe cada
+    PARTIAL_INTERVAL segundos en segundo plano y el texto parcial se
+    entrega a esa función mientras el usuario sigue hablando.
+    """
     show_status("Grabando audio...", "info")
     
     # Buffer para almacenar el audio
@@ -60,8 +76,25 @@ def record_audio(sample_rate=16000, silence_threshold=0.02, silence_duration=2.0
     try:
         with sd.InputStream(samplerate=sample_rate, channels=1, dtype='float32', callback=callback):
             show_status("Habla ahora... (esperando silencio para terminar)", "info")
+            partial_thread = None
+            partials_stopped = threading.Event()
+            next_partial = int(PARTIAL_INTERVAL * sample_rate)
             while silence_counter < silence_samples and total_samples < max_samples:
                 sd.sleep(100)  # Esperar 100ms entre verificaciones
+
+                # Lanzar una transcripción parcial si la anterior ya terminó
+                if on_partial and total_samples >= next_partial and audio_buffer:
+                    if partial_thread is None or not partial_thread.is_alive():
+                        partial_thread = threading.Thread(
+                            target=_run_partial,
+                            args=(list(audio_buffer), on_partial, partials_stopped),
+                            daemon=True
+                        )
+                        partial_thread.start()
+                        next_partial = total_samples + int(PARTIAL_INTERVAL * sample_rate)
+
+            # Abandonar la parcial en curso para no retrasar la transcripción final
+            partials_stopped.set()
             
         # Concatenar todos los fragmentos de audio
         if audio_buffer:
@@ -82,10 +115,10 @@ def save_audio(audio_data, sample_rate=16000):
             wf.writeframes((audio_data * 32767).astype(np.int16).tobytes())
         return temp_file.name
 
-def listen(timeout=30, phrase_time_limit=30):
+def listen(timeout=30, phrase_time_limit=30, on_partial=None):
     try:
         # Grabar audio hasta detectar silencio
-        audio_data = record_audio()
+        audio_data = record_audio(on_partial=on_partial)
         
         if audio_data is None or len(audio_data) == 0:
             show_status("No se detectó audio", "warning")
@@ -96,8 +129,7 @@ def listen(timeout=30, phrase_time_limit=30):
         
         # Transcribir
         show_status("Transcribiendo audio...", "thinking")
-        segments, _ = model.transcribe(temp_file, language="es")
-        text = " ".join([segment.text for segment in segments])
+        text = engine.transcribe(temp_file)
         
         # Limpiar archivo temporal
         os.unlink(temp_file)
@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import wave
+import threading
+import numpy as np
+from faster_whisper import WhisperModel
+from dotenv import load_dotenv
+from ui import show_status
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Configuración del gestor de Whisper
+DEVICE = os.getenv('WHISPER_DEVICE', 'cpu')
+MODEL_SIZE = os.getenv('WHISPER_MODEL_SIZE', 'auto')
+COMPUTE_TYPE = os.getenv('WHISPER_COMPUTE_TYPE', 'auto')
+RTF_TARGET = float(os.getenv('WHISPER_RTF_TARGET', 0.5))
+LANGUAGE = os.getenv('WHISPER_LANGUAGE', 'es')
+PROFILE_PATH = os.getenv('WHISPER_PROFILE_PATH', os.path.join('db', 'stt_profile.json'))
+BENCHMARK_AUDIO = os.getenv('WHISPER_BENCHMARK_AUDIO', os.path.join('fixtures', 'speech'))
+
+# Candidatos ordenados del más preciso al más rápido
+MODEL_SIZES = ["small", "base", "tiny"]
+COMPUTE_TYPES = {
+    "cpu": ["int8", "float32"],
+    "cuda": ["float16", "int8_float16"],
+}
+
+# Tamaños de beam a probar, del más rápido al más preciso
+BEAM_SIZES = [1, 2, 5]
+
+SAMPLE_RATE = 16000
+# Como mucho se miden estos segundos de las grabaciones de prueba
+BENCHMARK_SECONDS = 10
+# Un modelo se considera sobrecargado si su RTF medio supera el objetivo por este factor
+OVERLOAD_FACTOR = 1.5
+# Peso de la última medición en la media móvil del RTF
+RTF_SMOOTHING = 0.3
+
+def _read_wav(path):
+    with wave.open(path, 'rb') as wf:
+        frames = wf.readframes(wf.getnframes())
+    return np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32767
+
+def _load_benchmark_audio():
+    """Voz real para el benchmark: un WAV o los WAV de un directorio, o None si no hay"""
+    if os.path.isfile(BENCHMARK_AUDIO):
+        paths = [BENCHMARK_AUDIO]
+    elif os.path.isdir(BENCHMARK_AUDIO):
+        paths = [os.path.join(BENCHMARK_AUDIO, f) for f in sorted(os.listdir(BENCHMARK_AUDIO)) if f.endswith(".wav")]
+    else:
+        paths = []
+    if not paths:
+        return None
+    audio = np.concatenate([_read_wav(path) for path in paths])
+    return audio[:SAMPLE_RATE * BENCHMARK_SECONDS]
+
+def _thread_options():
+    cores = os.cpu_count() or 4
+    return sorted({cores, max(cores // 2, 1)}, reverse=True)
+
+def load_profile():
+    """Devolver el perfil configurado en .env o guardado en disco, o None si falta"""
+    # Una configuración explícita en .env tiene prioridad sobre el benchmark
+    if MODEL_SIZE != 'auto' and COMPUTE_TYPE != 'auto':
+        return {
+            "device": DEVICE,
+            "model_size": MODEL_SIZE,
+            "compute_type": COMPUTE_TYPE,
+            "beam_size": 1 if DEVICE == 'cpu' else 5,
+            "cpu_threads": os.cpu_count() or 4,
+        }
+
+    if os.path.exists(PROFILE_PATH):
+        try:
+            with open(PROFILE_PATH, "r") as f:
+                profile = json.load(f)
+            # El perfil guardado solo vale si respeta lo que se fijó en .env
+            matches = (
+                profile.get("device") == DEVICE
+                and MODEL_SIZE in ('auto', profile.get("model_size"))
+                and COMPUTE_TYPE in ('auto', profile.get("compute_type"))
+            )
+            if matches:
+                show_status(f"Perfil de Whisper cargado: {profile['model_size']} ({profile['compute_type']})", "info")
+                return profile
+        except (OSError, ValueError, KeyError):
+            pass
+    return None
+
+class WhisperEngineManager:
+    """Elige y administra el modelo de Whisper según la capacidad del equipo.
+
+    En la primera ejecución mide el factor de tiempo real (RTF) de las
+    combinaciones de modelo, tipo de cómputo, hilos y beam sobre grabaciones
+    de voz reales y se queda con la más precisa que cumple
+    WHISPER_RTF_TARGET. El perfil se guarda en disco. Si durante la sesión
+    el RTF medio se dispara y el tamaño no está fijado en .env, cambia a un
+    modelo más pequeño.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.profile = self._load_or_create_profile()
+        self.cpu_threads = self.profile.get("cpu_threads", os.cpu_count() or 4)
+        self.language = None if LANGUAGE == 'auto' else LANGUAGE
+        self._rtf_avg = None
+        self.last_wait = 0.0
+        self.model = self._load_model(self.profile["model_size"], self.profile["compute_type"])
+
+    def _load_model(self, model_size, compute_type):
+        show_status(f"Cargando modelo de Whisper ({model_size}, {compute_type})...", "loading")
+        model = WhisperModel(
+            model_size,
+            device=DEVICE,
+            compute_type=compute_type,
+            cpu_threads=self.cpu_threads
+        )
+        show_status("Modelo de Whisper cargado", "success")
+        return model
+
+    def _load_or_create_profile(self):
+        profile = load_profile()
+        if profile is not None:
+            return profile
+
+        profile = self.benchmark()
+        if profile.get("rtf") is not None:
+            self._save_profile(profile)
+        return profile
+
+    def _save_profile(self, profile):
+        try:
+            os.makedirs(os.path.dirname(PROFILE_PATH) or '.', exist_ok=True)
+            with open(PROFILE_PATH, "w") as f:
+                json.dump(profile, f, indent=2)
+        except OSError as e:
+            show_status(f"No se pudo guardar el perfil de Whisper: {str(e)}", "warning")
+
+    def benchmark(self):
+        """Medir el RTF de los candidatos y elegir el mejor que cumpla el objetivo.
+
+        Los tamaños se prueban del más pequeño al más grande, empezando
+        cada uno por su configuración más rápida (primer tipo de cómputo,
+        todos los hilos, beam 1). Si esa ya no cumple el objetivo, los
+        tamaños mayores tampoco lo harán y no se descargan ni se miden.
+        Se elige el modelo más grande que cumple y, dentro de él, el beam
+        más grande y luego el RTF más bajo.
+        """
+        sizes = MODEL_SIZES[::-1] if MODEL_SIZE == 'auto' else [MODEL_SIZE]
+        compute_types = COMPUTE_TYPES.get(DEVICE, ["int8"]) if COMPUTE_TYPE == 'auto' else [COMPUTE_TYPE]
+        language = None if LANGUAGE == 'auto' else LANGUAGE
+        fallback = {
+            "device": DEVICE,
+            "model_size": sizes[0],
+            "compute_type": compute_types[0],
+            "beam_size": 1,
+            "cpu_threads": os.cpu_count() or 4,
+        }
+
+        audio = _load_benchmark_audio()
+        if audio is None:
+            # Sin voz real el benchmark no es representativo; no se guarda perfil
+            show_status(f"No hay grabaciones de voz en {BENCHMARK_AUDIO} para medir Whisper "
+                        "(ver fixtures/README.md); se usa un perfil conservador", "warning")
+            return fallback
+
+        show_status("Midiendo el rendimiento de Whisper en este equipo...", "loading")
+        duration = len(audio) / SAMPLE_RATE
+
+        def measure(model, model_size, compute_type, cpu_threads, beam_size):
+            start = time.time()
+            list(model.transcribe(audio, beam_size=beam_size, language=language)[0])
+            rtf = (time.time() - start) / duration
+            show_status(f"Whisper {model_size} ({compute_type}, {cpu_threads} hilos, "
+                        f"beam {beam_size}): RTF {rtf:.2f}", "info")
+            return {
+                "device": DEVICE,
+                "model_size": model_size,
+                "compute_type": compute_type,
+                "beam_size": beam_size,
+                "cpu_threads": cpu_threads,
+                "rtf": round(rtf, 3),
+            }
+
+        best = None
+        fastest = None
+        for model_size in sizes:
+            passing = []
+            probed = False
+            for compute_type in compute_types:
+                for cpu_threads in _thread_options():
+                    try:
+                        model = WhisperModel(model_size, device=DEVICE, compute_type=compute_type,
+                                             cpu_threads=cpu_threads)
+                        # Primera pasada para calentar
+                        list(model.transcribe(audio[:SAMPLE_RATE], beam_size=1, language=language)[0])
+                    except Exception as e:
+                        show_status(f"Whisper {model_size} ({compute_type}) no disponible: {str(e)}", "warning")
+                        break
+
+                    # Beams de menor a mayor: al primero que no cumple, los mayores tampoco
+                    for beam_size in BEAM_SIZES:
+                        candidate = measure(model, model_size, compute_type, cpu_threads, beam_size)
+                        if fastest is None or candidate["rtf"] < fastest["rtf"]:
+                            fastest = candidate
+                        if candidate["rtf"] > RTF_TARGET:
+                            break
+                        passing.append(candidate)
+
+                    if not probed:
+                        probed = True
+                        if not passing:
+                            # Ni la configuración más rápida de este tamaño cumple
+                            break
+                if probed and not passing:
+                    break
+
+            if not passing:
+                # Los modelos más grandes serán aún más lentos
+                break
+            best = min(passing, key=lambda c: (-c["beam_size"], c["rtf"]))
+
+        if best is not None:
+            return best
+
+        if fastest is None:
+            # Ningún candidato pudo cargarse; usar el más pequeño sin medir
+            return fallback
+
+        show_status("Ningún modelo cumple el objetivo de RTF, se usa el más rápido", "warning")
+        return fastest
+
+    def _downgrade(self):
+        """Cambiar al siguiente modelo más pequeño cuando el equipo está cargado"""
+        # Un tamaño fijado en .env se respeta aunque el equipo vaya lento
+        if MODEL_SIZE != 'auto':
+            return
+        current = self.profile["model_size"]
+        if current not in MODEL_SIZES or current == MODEL_SIZES[-1]:
+            return
+        smaller = MODEL_SIZES[MODEL_SIZES.index(current) + 1]
+        show_status(f"Whisper va lento (RTF {self._rtf_avg:.2f}), cambiando a {smaller}", "warning")
+        self.model = self._load_model(smaller, self.profile["compute_type"])
+        self.profile = dict(self.profile, model_size=smaller)
+        self._rtf_avg = None
+
+    def transcribe(self, audio, language=None, partial=False, cancel=None):
+        """Transcribir un archivo o array de audio y devolver el texto.
+
+        Las transcripciones parciales (partial=True) no cuentan para la media
+        de RTF, porque compiten con la grabación por la CPU, y se abandonan
+        entre segmentos en cuanto se activa el evento cancel.
+        """
+        wait_start = time.time()
+        with self._lock:
+            if not partial:
+                # Tiempo que la transcripción final esperó a una parcial en curso
+                self.last_wait = time.time() - wait_start
+            if cancel is not None and cancel.is_set():
+                return ""
+
+            language = language or self.language
+            start = time.time()
+            segments, info = self.model.transcribe(
+                audio,
+                language=language,
+                beam_size=self.profile.get("beam_size", 1)
+            )
+            texts = []
+            for segment in segments:
+                if cancel is not None and cancel.is_set():
+                    return ""
+                texts.append(segment.text)
+            text = " ".join(texts).strip()
+            elapsed = time.time() - start
+
+            # Identificar el idioma una sola vez por sesión
+            if self.language is None and info.language:
+                self.language = info.language
+                show_status(f"Idioma detectado: {info.language} ({info.language_probability:.0%})", "info")
+
+            if info.duration and not partial:
+                rtf = elapsed / info.duration
+                if self._rtf_avg is None:
+                    self._rtf_avg = rtf
+                else:
+                    self._rtf_avg = RTF_SMOOTHING * rtf + (1 - RTF_SMOOTHING) * self._rtf_avg
+                if self._rtf_avg > RTF_TARGET * OVERLOAD_FACTOR:
+                    self._downgrade()
+
+            return text
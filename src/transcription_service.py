@@ -0,0 +1,159 @@
+import os
+import time
+import queue
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dotenv import load_dotenv
+from ui import show_status
+from stt_engine import load_profile, DEVICE, LANGUAGE
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Configuración del servicio de transcripción
+STT_WORKERS = int(os.getenv('STT_WORKERS', max((os.cpu_count() or 1) // 2, 1)))
+STT_BATCH_SIZE = int(os.getenv('STT_BATCH_SIZE', 4))
+STT_BATCH_WINDOW_MS = int(os.getenv('STT_BATCH_WINDOW_MS', 50))
+# Resultados recientes que se conservan por stream
+STT_RESULTS_PER_STREAM = int(os.getenv('STT_RESULTS_PER_STREAM', 50))
+
+# Modelo propio de cada proceso trabajador
+_worker_model = None
+
+def _init_worker(model_size, compute_type, cpu_threads):
+    """Cargar el modelo de Whisper una sola vez por proceso"""
+    global _worker_model
+    from faster_whisper import WhisperModel
+    _worker_model = WhisperModel(model_size, device=DEVICE, compute_type=compute_type,
+                                 cpu_threads=cpu_threads)
+
+def _transcribe_batch(batch, language, beam_size):
+    """Transcribir un lote de (id, audio) en el proceso trabajador"""
+    results = []
+    for utterance_id, audio in batch:
+        try:
+            segments, _ = _worker_model.transcribe(audio, language=language, beam_size=beam_size)
+            results.append((utterance_id, " ".join([s.text for s in segments]).strip(), None))
+        except Exception as e:
+            results.append((utterance_id, None, str(e)))
+    return results
+
+class TranscriptionService:
+    """Transcribe frases de varias fuentes de audio a la vez.
+
+    Las frases entran por submit() con el identificador de su stream. Un
+    hilo despachador las agrupa en micro-lotes (hasta STT_BATCH_SIZE o
+    STT_BATCH_WINDOW_MS) y reparte cada lote entre todos los procesos
+    trabajadores, cada uno con su propio modelo, para que ninguno quede
+    ocioso mientras otro transcribe un lote entero. Así varios micrófonos
+    o clientes remotos no esperan en fila detrás de un único modelo.
+    """
+
+    def __init__(self, workers=STT_WORKERS, batch_size=STT_BATCH_SIZE, batch_window_ms=STT_BATCH_WINDOW_MS):
+        profile = load_profile() or {"model_size": "tiny", "compute_type": "int8", "beam_size": 1}
+        self.language = None if LANGUAGE == 'auto' else LANGUAGE
+        self.beam_size = profile.get("beam_size", 1)
+        self.batch_size = batch_size
+        self.batch_window = batch_window_ms / 1000
+        self.workers = workers
+
+        # Repartir los núcleos entre los trabajadores
+        cpu_threads = max((os.cpu_count() or 1) // workers, 1)
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(profile["model_size"], profile["compute_type"], cpu_threads)
+        )
+
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._next_id = 0
+        self._results = defaultdict(lambda: deque(maxlen=STT_RESULTS_PER_STREAM))
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._dispatcher.start()
+        show_status(f"Servicio de transcripción iniciado con {workers} procesos", "success")
+
+    def submit(self, stream_id, audio):
+        """Encolar una frase (array float32 a 16 kHz) y devolver un Future con el texto"""
+        if not self._running:
+            raise RuntimeError("El servicio de transcripción está detenido")
+        future = Future()
+        with self._pending_lock:
+            utterance_id = self._next_id
+            self._next_id += 1
+            self._pending[utterance_id] = (stream_id, future)
+        self._queue.put((utterance_id, audio.flatten()))
+        return future
+
+    def transcribe(self, stream_id, audio):
+        """Versión bloqueante de submit()"""
+        return self.submit(stream_id, audio).result()
+
+    def results(self, stream_id):
+        """Últimos textos transcritos de un stream, en el orden en que se completaron"""
+        return list(self._results.get(stream_id, ()))
+
+    def close_stream(self, stream_id):
+        """Olvidar los resultados de un stream que ya no envía audio"""
+        self._results.pop(stream_id, None)
+
+    def _dispatch_loop(self):
+        while self._running:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            # Juntar lo que llegue dentro de la ventana para formar un lote
+            batch = [first]
+            deadline = time.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Repartir el lote entre los trabajadores en lugar de fijarlo a uno
+            shards = [batch[i::self.workers] for i in range(min(self.workers, len(batch)))]
+            for shard in shards:
+                task = self._pool.submit(_transcribe_batch, shard, self.language, self.beam_size)
+                task.add_done_callback(lambda t, ids=[u for u, _ in shard]: self._complete(t, ids))
+
+    def _complete(self, task, utterance_ids):
+        try:
+            results = task.result()
+        except Exception as e:
+            results = [(u, None, str(e)) for u in utterance_ids]
+
+        for utterance_id, text, error in results:
+            with self._pending_lock:
+                entry = self._pending.pop(utterance_id, None)
+            if entry is None:
+                # Ya se marcó como fallida al detener el servicio
+                continue
+            stream_id, future = entry
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                self._results[stream_id].append(text)
+                future.set_result(text)
+
+    def shutdown(self):
+        """Detener el servicio; las frases aún sin transcribir fallan en vez de quedar colgadas"""
+        self._running = False
+        self._dispatcher.join()
+        self._pool.shutdown(cancel_futures=True)
+
+        # Lo que siguiera en la cola ya no se enviará a ningún trabajador
+        with self._pending_lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("El servicio de transcripción se detuvo"))
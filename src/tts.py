@@ -1,156 +1,210 @@
 import os
+import re
 import requests
-import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from ui import show_status
-import pygame
+from resilience import breakers
+import numpy as np
+import sounddevice as sd
+import pyttsx3
 import time
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Configuración de la síntesis por frases
+TTS_MAX_WORKERS = int(os.getenv('TTS_MAX_WORKERS', 3))
+TTS_SAMPLE_RATE = 22050  # Corresponde al formato pcm_22050 de ElevenLabs
+TTS_FADE_MS = 5  # Rampa en los bordes de cada frase para evitar clics
+# Frases sintetizadas que se guardan en memoria (0 = sin caché)
+TTS_CACHE_SIZE = int(os.getenv('TTS_CACHE_SIZE', 32))
+# Frases habituales de los personajes y de respuestas que pueden salir de la
+# caché de respuestas; van aparte para que las respuestas normales no las desalojen
+TTS_REPLY_CACHE_SIZE = int(os.getenv('TTS_REPLY_CACHE_SIZE', 128))
+# Tiempo máximo por frase antes de pasar a la voz local (segundos)
+TTS_TIMEOUT = float(os.getenv('TTS_TIMEOUT', 10))
+
+def split_sentences(text):
+    """Dividir una respuesta en frases para sintetizarlas por separado"""
+    sentences = re.split(r'(?<=[.!?…])\s+', text.strip())
+    return [s for s in sentences if s.strip()]
+
 class TTS:
     def __init__(self):
         self.api_key = os.environ['ELEVENLABS_API_KEY']
         self.base_url = "https://api.elevenlabs.io/v1/text-to-speech"
-        
-        # Inicializar pygame mixer con parámetros específicos
-        try:
-            pygame.mixer.quit()  # Asegurarse de que no hay instancias previas
-            pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=4096)
-            show_status("Sistema de audio inicializado correctamente", "success")
-        except Exception as e:
-            show_status(f"Error al inicializar el sistema de audio: {str(e)}", "error")
+        self._executor = ThreadPoolExecutor(max_workers=TTS_MAX_WORKERS)
+        self.last_time_to_first_audio = None
+        self.last_max_gap = None
+        self._audio_cache = OrderedDict()
+        self._reply_audio_cache = OrderedDict()
+        self._audio_cache_lock = threading.Lock()
+        self._offline_engine = None
         
         if not self.api_key:
             show_status("Error: No hay API key de ElevenLabs configurada", "error")
             show_status("Por favor, configura ELEVENLABS_API_KEY en tu archivo .env", "error")
 
-    def generate_speech(self, text, voice_id):
-        """Generar audio a partir de texto usando ElevenLabs"""
-        try:
-            if not self.api_key:
-                show_status("Error: No hay API key de ElevenLabs configurada", "error")
-                return None
+    def synthesize_pcm(self, text, voice_id):
+        """Sintetizar una frase como PCM 16 bits mono a TTS_SAMPLE_RATE"""
+        if not self.api_key or not voice_id:
+            return None
 
-            if not voice_id:
-                show_status("Error: No hay Voice ID configurado para el personaje", "error")
-                return None
+        # Con el circuito abierto no se espera a ElevenLabs
+        if not breakers["tts"].allow():
+            return None
 
-            show_status(f"Usando Voice ID: {voice_id}", "info")
-            show_status("Generando audio...", "loading")
-            
-            headers = {
-                "Accept": "audio/mpeg",
-                "Content-Type": "application/json",
-                "xi-api-key": self.api_key
-            }
+        headers = {
+            "Content-Type": "application/json",
+            "xi-api-key": self.api_key
+        }
 
-            data = {
-                "text": text,
-                "model_id": "eleven_multilingual_v2",
-                "voice_settings": {
-                    "stability": 0.5,
-                    "similarity_boost": 0.75
-                }
+        data = {
+            "text": text,
+            "model_id": "eleven_multilingual_v2",
+            "voice_settings": {
+                "stability": 0.5,
+                "similarity_boost": 0.75
             }
+        }
 
-            show_status(f"Enviando solicitud a ElevenLabs...", "info")
+        try:
             response = requests.post(
                 f"{self.base_url}/{voice_id}",
+                params={"output_format": f"pcm_{TTS_SAMPLE_RATE}"},
                 json=data,
-                headers=headers
+                headers=headers,
+                timeout=TTS_TIMEOUT
             )
-
-            if response.status_code == 200:
-                show_status("Audio generado correctamente", "success")
-                # Guardar el audio en un archivo temporal
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
-                    temp_file.write(response.content)
-                    show_status(f"Audio guardado en: {temp_file.name}", "info")
-                    return temp_file.name
-            else:
+            if response.status_code != 200:
                 show_status(f"Error en la API de ElevenLabs: {response.status_code}", "error")
-                show_status(f"Respuesta: {response.text}", "error")
+                breakers["tts"].record_failure()
                 return None
-
         except Exception as e:
             show_status(f"Error al generar audio: {str(e)}", "error")
+            breakers["tts"].record_failure()
             return None
+        breakers["tts"].record_success()
+
+        pcm = np.frombuffer(response.content, dtype=np.int16).copy()
+
+        # Rampa de entrada y salida para que las frases se unan sin clics
+        fade = min(int(TTS_SAMPLE_RATE * TTS_FADE_MS / 1000), len(pcm) // 2)
+        if fade:
+            ramp = np.linspace(0.0, 1.0, fade)
+            pcm[:fade] = (pcm[:fade] * ramp).astype(np.int16)
+            pcm[-fade:] = (pcm[-fade:] * ramp[::-1]).astype(np.int16)
+        return pcm
 
-    def play_audio(self, audio_file):
-        """Reproducir un archivo de audio"""
+    def synthesize_cached(self, text, voice_id, reply_cache=False):
+        """Sintetizar una frase reutilizando el audio si ya se generó antes.
+
+        Con reply_cache=True el audio se guarda en la caché reservada a las
+        respuestas cacheables, que las respuestas normales no desalojan.
+        """
+        key = (voice_id, text)
+        if reply_cache:
+            cache, size = self._reply_audio_cache, TTS_REPLY_CACHE_SIZE
+        else:
+            cache, size = self._audio_cache, TTS_CACHE_SIZE
+        with self._audio_cache_lock:
+            for store in (self._reply_audio_cache, self._audio_cache):
+                if key in store:
+                    store.move_to_end(key)
+                    return store[key]
+
+        pcm = self.synthesize_pcm(text, voice_id)
+        if pcm is not None and size > 0:
+            with self._audio_cache_lock:
+                cache[key] = pcm
+                while len(cache) > size:
+                    cache.popitem(last=False)
+        return pcm
+
+    def speak_offline(self, text):
+        """Leer el texto con la voz local (pyttsx3) cuando ElevenLabs no está disponible"""
         try:
-            if not audio_file:
-                return
-
-            show_status("Reproduciendo audio...", "info")
-            
-            # Asegurarse de que el mixer esté limpio
-            try:
-                pygame.mixer.music.stop()
-                pygame.mixer.music.unload()
-            except:
-                pass
-            
-            # Verificar que el archivo existe
-            if not os.path.exists(audio_file):
-                show_status(f"Error: El archivo de audio no existe: {audio_file}", "error")
-                return
-            
-            # Verificar el tamaño del archivo
-            file_size = os.path.getsize(audio_file)
-            show_status(f"Tamaño del archivo de audio: {file_size} bytes", "info")
-            
-            if file_size == 0:
-                show_status("Error: El archivo de audio está vacío", "error")
-                return
-            
-            # Cargar y reproducir el audio
-            try:
-                show_status("Cargando archivo de audio...", "info")
-                pygame.mixer.music.load(audio_file)
-                show_status("Iniciando reproducción...", "info")
-                pygame.mixer.music.play()
-                
-                # Esperar a que termine la reproducción
-                while pygame.mixer.music.get_busy():
-                    pygame.time.Clock().tick(10)
-                    time.sleep(0.1)  # Pequeña pausa para no saturar la CPU
-                
-                # Asegurarse de que el mixer esté limpio
-                pygame.mixer.music.stop()
-                pygame.mixer.music.unload()
-                
-                show_status("Audio reproducido", "success")
-            except Exception as e:
-                show_status(f"Error al reproducir audio: {str(e)}", "error")
-            finally:
-                # Limpiar el archivo temporal
-                try:
-                    os.unlink(audio_file)
-                except:
-                    pass
+            if self._offline_engine is None:
+                self._offline_engine = pyttsx3.init()
+            self._offline_engine.say(text)
+            self._offline_engine.runAndWait()
+        except Exception as e:
+            show_status(f"Error en la voz local: {str(e)}", "error")
+
+    def speak(self, text, voice_id, reply_cache=False):
+        """Sintetizar las frases en paralelo y reproducirlas en orden sin pausas"""
+        show_status(f"Preparando texto para TTS: {text[:50]}...", "info")
+        sentences = split_sentences(text)
+        if not sentences:
+            return
+
+        start = time.time()
+        first_audio = None
+        gaps = []
+
+        # Las frases se sintetizan en paralelo; el pool acota las solicitudes simultáneas
+        futures = [self._executor.submit(self.synthesize_cached, s, voice_id, reply_cache) for s in sentences]
 
+        # Un único stream de salida: las frases se escriben una tras otra
+        stream = None
+        try:
+            clip_end = None
+            for sentence, future in zip(sentences, futures):
+                pcm = future.result()
+                if pcm is None or len(pcm) == 0:
+                    # Sin mezclador por software (ALSA) el dispositivo queda ocupado
+                    # mientras el stream esté abierto: terminar lo ya enviado y
+                    # cerrarlo antes de usar la voz local
+                    if stream is not None:
+                        stream.stop()
+                        stream.close()
+                        stream = None
+                    self.speak_offline(sentence)
+                    clip_end = time.time()
+                    continue
+
+                if stream is None:
+                    stream = sd.OutputStream(samplerate=TTS_SAMPLE_RATE, channels=1, dtype='int16')
+                    stream.start()
+
+                now = time.time()
+                if first_audio is None:
+                    first_audio = now - start
+                elif clip_end is not None:
+                    # Tiempo que el stream quedó sin datos esperando esta frase
+                    gaps.append(max(now - clip_end, 0.0))
+
+                stream.write(pcm.reshape(-1, 1))
+                # stream.write retorna cuando el audio está en el buffer;
+                # la frase termina de sonar tras la latencia del stream
+                clip_end = time.time() + stream.latency
         except Exception as e:
             show_status(f"Error al reproducir audio: {str(e)}", "error")
-            # Asegurarse de que el mixer esté limpio incluso en caso de error
-            try:
-                pygame.mixer.music.stop()
-                pygame.mixer.music.unload()
-            except:
-                pass
-
-    def speak(self, text, voice_id):
-        """Generar y reproducir audio en un solo paso"""
-        show_status(f"Preparando texto para TTS: {text[:50]}...", "info")
-        audio_file = self.generate_speech(text, voice_id)
-        if audio_file:
-            self.play_audio(audio_file)
+            for future in futures:
+                future.cancel()
+            return
+        finally:
+            if stream is not None:
+                # stop() espera a que suene lo que queda en el buffer
+                stream.stop()
+                stream.close()
+
+        if first_audio is not None:
+            self.last_time_to_first_audio = first_audio
+            self.last_max_gap = max(gaps) if gaps else 0.0
+            show_status(
+                f"TTS: primer audio en {first_audio * 1000:.0f} ms, "
+                f"pausa máxima entre frases {self.last_max_gap * 1000:.0f} ms "
+                f"({len(sentences)} frases)",
+                "info"
+            )
 
 # Instancia global de TTS
 tts_engine = TTS()
 
-def speak(text, voice_id):
+def speak(text, voice_id, reply_cache=False):
     """Función de conveniencia para usar el TTS"""
-    tts_engine.speak(text, voice_id)
+    tts_engine.speak(text, voice_id, reply_cache)
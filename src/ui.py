@@ -44,7 +44,7 @@ def show_message(role, text, tts_callback=None):
     elif role.upper() == "FATAL":
         color = Colors.RED
         symbol = Symbols.ERROR
-    elif role.upper() in ["TARS", "GLADOS"]:  # Agregamos GLaDOS como un rol especial
+    elif tts_callback or role.upper() in ["TARS", "GLADOS"]:  # Cualquier personaje con voz
         color = Colors.GREEN
         symbol = Symbols.SPEAKER
     elif role.upper() == "USUARIO":
@@ -57,17 +57,16 @@ def show_message(role, text, tts_callback=None):
     # Mostrar mensaje con formato
     print(f"{color}[{timestamp}] {symbol} {role.upper()}: {text}{Colors.RESET}\n")
     
-    # Activar TTS solo para mensajes de TARS o GLaDOS si hay callback
-    if role.upper() in ["TARS", "GLADOS"] and tts_callback:
-        from tts import speak  # Importación local para evitar ciclo
+    # Activar TTS para cualquier personaje que tenga callback de voz
+    if tts_callback:
         tts_callback(text)
 
-def show_message_with_tts(role, text, character=None):
+def show_message_with_tts(role, text, character=None, reply_cache=False):
     """Mostrar mensaje y activar TTS si es necesario"""
     if character and character.voice_id:
         print(f"[DEBUG] TTS configurado para {character.name} con voice_id: {character.voice_id}")
         from tts import speak  # Importación local para evitar ciclo
-        show_message(character.name, text, tts_callback=lambda t: speak(t, character.voice_id))
+        show_message(character.name, text, tts_callback=lambda t: speak(t, character.voice_id, reply_cache))
     else:
         print(f"[DEBUG] TTS no configurado para {character.name if character else 'None'}")
         show_message(role, text)
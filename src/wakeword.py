@@ -0,0 +1,237 @@
+import os
+import time
+import wave
+import numpy as np
+import sounddevice as sd
+from dotenv import load_dotenv
+from ui import show_status
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Configuración de la palabra de activación
+WAKEWORD_ENABLED = os.getenv('WAKEWORD_ENABLED', 'false').lower() == 'true'
+WAKEWORD_TEMPLATES_DIR = os.getenv('WAKEWORD_TEMPLATES_DIR', os.path.join('data', 'wakeword'))
+WAKEWORD_THRESHOLD = float(os.getenv('WAKEWORD_THRESHOLD', 0.35))
+
+SAMPLE_RATE = 16000
+FRAME_SIZE = 400  # 25 ms
+HOP_SIZE = 160    # 10 ms, también el tamaño de bloque del micrófono
+N_FFT = 512
+N_MELS = 20
+# Duración admitida de una ráfaga de voz para ser candidata (segundos)
+MIN_BURST = 0.3
+MAX_BURST = 2.0
+# Silencio que cierra una ráfaga (segundos)
+BURST_GAP = 0.2
+# Una trama es voz si su energía supera el ruido de fondo por este factor
+ENERGY_RATIO = 3.0
+MIN_ENERGY = 0.005
+# Una ráfaga cuya duración difiere de todas las plantillas más que este
+# factor se descarta sin calcular DTW
+MAX_LENGTH_RATIO = 2.0
+
+def _mel_filterbank():
+    def hz_to_mel(hz):
+        return 2595 * np.log10(1 + hz / 700)
+
+    def mel_to_hz(mel):
+        return 700 * (10 ** (mel / 2595) - 1)
+
+    mels = np.linspace(hz_to_mel(60), hz_to_mel(SAMPLE_RATE / 2), N_MELS + 2)
+    bins = np.floor((N_FFT + 1) * mel_to_hz(mels) / SAMPLE_RATE).astype(int)
+    bank = np.zeros((N_MELS, N_FFT // 2 + 1))
+    for m in range(1, N_MELS + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        if center > left:
+            bank[m - 1, left:center] = (np.arange(left, center) - left) / (center - left)
+        if right > center:
+            bank[m - 1, center:right] = (right - np.arange(center, right)) / (right - center)
+    return bank
+
+_MEL_BANK = _mel_filterbank()
+_WINDOW = np.hanning(FRAME_SIZE)
+
+def extract_features(audio):
+    """Energías log-mel por trama, normalizadas por su media"""
+    audio = audio.flatten()
+    if len(audio) < FRAME_SIZE:
+        audio = np.pad(audio, (0, FRAME_SIZE - len(audio)))
+    count = 1 + (len(audio) - FRAME_SIZE) // HOP_SIZE
+    idx = np.arange(FRAME_SIZE)[None, :] + HOP_SIZE * np.arange(count)[:, None]
+    frames = audio[idx] * _WINDOW
+    power = np.abs(np.fft.rfft(frames, N_FFT)) ** 2
+    features = np.log(power @ _MEL_BANK.T + 1e-10)
+    return features - features.mean(axis=0)
+
+def frame_count(samples):
+    """Número de tramas que extract_features produce para tantas muestras"""
+    return 1 + max(samples - FRAME_SIZE, 0) // HOP_SIZE
+
+def dtw_distance(a, b):
+    """Distancia DTW entre dos secuencias de características, normalizada por longitud.
+
+    Cada fila se calcula de una vez con numpy. El paso horizontal
+    acc[j] = min(d[j], acc[j - 1] + cost[j]) se resuelve restando la suma
+    acumulada del coste: acc - C = minimum.accumulate(d - C).
+    """
+    a_norm = a / (np.linalg.norm(a, axis=1, keepdims=True) + 1e-10)
+    b_norm = b / (np.linalg.norm(b, axis=1, keepdims=True) + 1e-10)
+    cost = 1 - a_norm @ b_norm.T  # distancia coseno entre tramas
+    n, m = cost.shape
+    prev = np.full(m + 1, np.inf)
+    prev[0] = 0.0
+    for i in range(n):
+        row = cost[i]
+        # Mejor llegada desde la fila anterior (diagonal o vertical)
+        d = row + np.minimum(prev[:-1], prev[1:])
+        cumulative = np.cumsum(row)
+        current = np.empty(m + 1)
+        current[0] = np.inf
+        current[1:] = cumulative + np.minimum.accumulate(d - cumulative)
+        prev = current
+    return prev[m] / (n + m)
+
+def load_wav(path):
+    with wave.open(path, 'rb') as wf:
+        frames = wf.readframes(wf.getnframes())
+    return np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32767
+
+class BurstSegmenter:
+    """Separa ráfagas de voz de un flujo de bloques de 10 ms por su energía.
+
+    Lo usan tanto la escucha en vivo como la evaluación sobre grabaciones,
+    para que ambas vean exactamente los mismos candidatos.
+    """
+
+    def __init__(self):
+        self.noise_floor = MIN_ENERGY
+        self.burst = []
+        self.burst_energies = []
+        self.silent_blocks = 0
+        self.gap_blocks = int(BURST_GAP * SAMPLE_RATE / HOP_SIZE)
+        self.max_blocks = int(MAX_BURST * SAMPLE_RATE / HOP_SIZE)
+        self.min_blocks = int(MIN_BURST * SAMPLE_RATE / HOP_SIZE)
+
+    def feed(self, block):
+        """Añadir un bloque; devuelve el audio de una ráfaga candidata al cerrarse, o None"""
+        energy = float(np.sqrt(np.mean(block ** 2)))
+        voiced = energy > max(self.noise_floor * ENERGY_RATIO, MIN_ENERGY)
+
+        if voiced:
+            self.burst.append(block.copy())
+            self.burst_energies.append(energy)
+            self.silent_blocks = 0
+        elif self.burst:
+            self.burst.append(block.copy())
+            self.burst_energies.append(energy)
+            self.silent_blocks += 1
+        else:
+            # Seguir el ruido de fondo solo en silencio
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * energy
+
+        if self.burst and (self.silent_blocks >= self.gap_blocks or len(self.burst) >= self.max_blocks):
+            voiced_blocks = len(self.burst) - self.silent_blocks
+            candidate = np.concatenate(self.burst)
+            if len(self.burst) >= self.max_blocks:
+                # Una ráfaga sin pausas tan larga suele ser ruido que subió (un
+                # ventilador, la tele): acercar el suelo a su parte más baja para
+                # no quedar sordos con todo marcado como voz
+                self.noise_floor = 0.5 * (self.noise_floor + min(self.burst_energies))
+            self.burst = []
+            self.burst_energies = []
+            self.silent_blocks = 0
+            if self.min_blocks <= voiced_blocks < self.max_blocks:
+                return candidate
+        return None
+
+    def segment(self, audio):
+        """Candidatos de una grabación completa, como si llegara por el micrófono"""
+        audio = audio.flatten()
+        # Silencio final para cerrar una ráfaga que llegue hasta el final
+        audio = np.concatenate([audio, np.zeros(self.gap_blocks * HOP_SIZE, dtype=audio.dtype)])
+        for start in range(0, len(audio) - HOP_SIZE + 1, HOP_SIZE):
+            candidate = self.feed(audio[start:start + HOP_SIZE])
+            if candidate is not None:
+                yield candidate
+
+class WakeWordDetector:
+    """Detector de palabra de activación por comparación con plantillas.
+
+    El micrófono se lee en bloques de 10 ms. Solo se mide la energía de
+    cada bloque; cuando termina una ráfaga de voz de duración plausible se
+    extraen sus características y se comparan por DTW con las grabaciones
+    de la palabra en WAKEWORD_TEMPLATES_DIR. Whisper no se usa hasta que
+    la palabra se reconoce.
+    """
+
+    def __init__(self, templates_dir=WAKEWORD_TEMPLATES_DIR, threshold=WAKEWORD_THRESHOLD):
+        self.threshold = threshold
+        self.templates = []
+        if os.path.isdir(templates_dir):
+            for file in sorted(os.listdir(templates_dir)):
+                if file.endswith(".wav"):
+                    # Recortar la plantilla igual que los candidatos en vivo: solo la ráfaga de voz
+                    bursts = list(BurstSegmenter().segment(load_wav(os.path.join(templates_dir, file))))
+                    if not bursts:
+                        show_status(f"La plantilla {file} no contiene una ráfaga de voz válida", "warning")
+                        continue
+                    self.templates.append(extract_features(max(bursts, key=len)))
+        self.cpu_usage = None
+        self.rejected_by_length = 0
+
+    def available(self):
+        return bool(self.templates)
+
+    def score(self, audio):
+        """Menor distancia entre el audio y las plantillas (menor es más parecido)"""
+        frames = frame_count(len(audio.flatten()))
+        # Comparar solo con plantillas de duración parecida; el resto no puede coincidir
+        candidates = [t for t in self.templates
+                      if 1 / MAX_LENGTH_RATIO <= frames / len(t) <= MAX_LENGTH_RATIO]
+        if not candidates:
+            self.rejected_by_length += 1
+            return np.inf
+        features = extract_features(audio)
+        return min(dtw_distance(features, template) for template in candidates)
+
+    def matches(self, audio):
+        return self.score(audio) <= self.threshold
+
+    def wait_for_wake_word(self):
+        """Bloquear hasta oír la palabra de activación"""
+        segmenter = BurstSegmenter()
+        cpu_start = time.process_time()
+        wall_start = time.time()
+        try:
+            with sd.InputStream(samplerate=SAMPLE_RATE, channels=1, dtype='float32', blocksize=HOP_SIZE) as stream:
+                while True:
+                    block, _ = stream.read(HOP_SIZE)
+                    candidate = segmenter.feed(block)
+                    if candidate is not None and self.matches(candidate):
+                        return True
+        finally:
+            wall = time.time() - wall_start
+            if wall > 0:
+                self.cpu_usage = (time.process_time() - cpu_start) / wall
+                show_status(f"Detector de activación: {self.cpu_usage:.1%} de CPU en espera", "info")
+
+    def detect_in(self, audio):
+        """Si la grabación activaría el detector, con la misma segmentación que en vivo"""
+        return any(self.matches(candidate) for candidate in BurstSegmenter().segment(audio))
+
+    def evaluate(self, positives_dir, negatives_dir):
+        """Tasas de falsa aceptación y falso rechazo sobre grabaciones de prueba.
+
+        Cada grabación pasa por el mismo filtro de energía y la misma
+        segmentación en ráfagas que el micrófono en wait_for_wake_word.
+        """
+        def run(directory):
+            files = [f for f in sorted(os.listdir(directory)) if f.endswith(".wav")]
+            return [self.detect_in(load_wav(os.path.join(directory, f))) for f in files]
+
+        positives = run(positives_dir)
+        negatives = run(negatives_dir)
+        false_reject = positives.count(False) / len(positives) if positives else 0.0
+        false_accept = negatives.count(True) / len(negatives) if negatives else 0.0
+        return false_accept, false_reject